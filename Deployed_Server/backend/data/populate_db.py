@@ -1,17 +1,23 @@
 import os
+import re
+import itertools
 import pandas as pd
 import numpy as np
 import pymysql
+import pyarrow as pa
+from pyarrow import csv as pacsv
 import tempfile
-from typing import Dict, List, Set, Tuple
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Set, Tuple
 from tqdm import tqdm
 import sys
 # Add the scripts folder to Python path
 scripts_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../scripts'))
 sys.path.append(scripts_dir)
 
-from DEPTH2 import depth2_calculation
-from DEPTH_ITH import depth_calculation
+from DEPTH_fused import depth_and_depth2_array
 from db_conn import get_connection
 
 # === CONFIGURATION ===
@@ -19,6 +25,34 @@ from db_conn import get_connection
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.normpath(os.path.join(SCRIPT_DIR, "..", "data", "raw"))
 BATCH_SIZE = 1000000
+# Parallel cancer-site workers; each holds a whole site's matrices in memory (several GB
+# for the largest sites), so the default stays small. Override with POPULATE_DB_WORKERS.
+MAX_WORKERS = max(1, int(os.environ.get("POPULATE_DB_WORKERS", min(2, os.cpu_count() or 1))))
+EXPRESSION_FILES = frozenset(
+    f"{prefix}_{norm}.csv"
+    for prefix in ("tumor", "normal")
+    for norm in ("tpm", "fpkm", "fpkm_uq")
+)
+# Sample types containing any of these keywords are normalized to "normal"
+_NORMAL_RE = re.compile(r"normal|control|benign")
+
+
+class SitePaths(NamedTuple):
+    """File locations of one cancer site folder, computed once per run."""
+    name: str
+    folder: str
+    sheet: str
+    tumor: Tuple[str, str, str]   # (tpm, fpkm, fpkm_uq)
+    normal: Tuple[str, str, str]  # (tpm, fpkm, fpkm_uq)
+    
+    @classmethod
+    def from_folder(cls, name: str, folder: str) -> "SitePaths":
+        def expression_paths(prefix: str) -> Tuple[str, str, str]:
+            return tuple(os.path.join(folder, f"{prefix}_{norm}.csv")
+                         for norm in ("tpm", "fpkm", "fpkm_uq"))
+        
+        return cls(name, folder, os.path.join(folder, "sample_sheet.csv"),
+                   expression_paths("tumor"), expression_paths("normal"))
 
 
 def normalize_sample_type(sample_type: str) -> str:
@@ -38,42 +72,71 @@ def normalize_sample_type(sample_type: str) -> str:
     if not sample_type:
         return "tumor"  # Default to tumor if empty
     
-    sample_type_lower = str(sample_type).strip().lower()
-    
-    # Check for normal types
-    normal_keywords = ['normal', 'control', 'benign']
-    if any(keyword in sample_type_lower for keyword in normal_keywords):
-        return "normal"
-    
-    # Everything else is considered tumor
-    return "tumor"
+    # Check for normal types; everything else is considered tumor
+    return "normal" if _NORMAL_RE.search(str(sample_type).strip().lower()) else "tumor"
+
+
+def map_ids(keys, id_map: Dict[str, int]) -> np.ndarray:
+    """
+    Map string keys to database ids using categorical codes, so each
+    distinct key is hashed once instead of once per row.
+    Returns: float64 array of ids, NaN where the key is not in id_map
+    """
+    categories = np.array(list(id_map.keys()), dtype=object)
+    # Trailing NaN so that code -1 (unknown key) picks it up
+    ids = np.append(np.array(list(id_map.values()), dtype=np.float64), np.nan)
+    codes = pd.Categorical(keys, categories=categories).codes
+    return ids[codes]
 
 
-def get_cancer_sites_from_directory(data_dir: str) -> List[str]:
+def fetch_id_map(cur, table: str, key_column: str, keys: List[str]) -> Dict[str, int]:
+    """
+    Fetch ids for the given keys only, instead of reading back the whole table.
+    The keys are bulk-inserted into a temporary table and joined against the
+    indexed key column, so the server never parses a huge IN (...) list.
+    Returns: Dictionary mapping key -> id
+    """
+    if not keys:
+        return {}
+    
+    # Same column type/collation as the key column, so the join can use its index
+    key_table = f"tmp_{table}_keys"
+    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {key_table}")
+    cur.execute(f"CREATE TEMPORARY TABLE {key_table} (PRIMARY KEY (k)) "
+                f"SELECT {key_column} AS k FROM {table} LIMIT 0")
+    try:
+        cur.executemany(f"INSERT IGNORE INTO {key_table} (k) VALUES (%s)",
+                        [(key,) for key in keys])
+        cur.execute(f"SELECT t.id, t.{key_column} FROM {table} t "
+                    f"JOIN {key_table} k ON t.{key_column} = k.k")
+        return {row[key_column]: row['id'] for row in cur.fetchall()}
+    finally:
+        cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {key_table}")
+
+
+def get_cancer_sites_from_directory(data_dir: str) -> List[SitePaths]:
     """
     Automatically detect all cancer sites from the data directory.
-    Returns: List of cancer site names (directory names)
+    Returns: List of SitePaths (one per site directory), sorted by site name
     """
     if not os.path.exists(data_dir):
         raise FileNotFoundError(f"Data directory not found: {data_dir}")
     
     cancer_sites = []
-    for item in os.listdir(data_dir):
-        item_path = os.path.join(data_dir, item)
-        if os.path.isdir(item_path):
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
             # Check if directory contains CSV files (has at least one expression file)
-            has_csv = any(
-                os.path.exists(os.path.join(item_path, f"{prefix}_{norm}.csv"))
-                for prefix in ["tumor", "normal"]
-                for norm in ["tpm", "fpkm", "fpkm_uq"]
-            )
-            if has_csv:
-                cancer_sites.append(item)
+            with os.scandir(entry.path) as children:
+                names = {child.name for child in children if child.is_file()}
+            if not names.isdisjoint(EXPRESSION_FILES):
+                cancer_sites.append(SitePaths.from_folder(entry.name, entry.path))
     
-    return sorted(cancer_sites)
+    return sorted(cancer_sites, key=lambda site: site.name)
 
 
-def populate_genes_table(conn, data_dir: str, cancer_names: List[str]) -> Dict[str, int]:
+def populate_genes_table(conn, sites: List[SitePaths]) -> Dict[str, int]:
     """
     Extract unique genes/annotations from CSV files and populate genes table.
     Returns: Dictionary mapping ensembl_id -> gene_id
@@ -81,22 +144,20 @@ def populate_genes_table(conn, data_dir: str, cancer_names: List[str]) -> Dict[s
     print("\nPopulating genes table...")
     cur = conn.cursor()
     
-    # Collect all unique genes from all CSV files
-    all_genes = set()
+    # Collect gene annotations from all CSV files, deduplicated once at the end
+    frames: List[pd.DataFrame] = []
     
-    for cancer_name in cancer_names:
-        folder_path = os.path.join(data_dir, cancer_name)
-        if not os.path.isdir(folder_path):
-            continue
-            
+    for site in sites:
         # Check any CSV file to get genes (they all have same genes)
-        tpm_path = os.path.join(folder_path, "tumor_tpm.csv")
+        tpm_path = site.tumor[0]
         if os.path.exists(tpm_path):
-            df = pd.read_csv(tpm_path, usecols=['gene_id', 'gene_name'], dtype=str)
-            genes_df = df[['gene_id', 'gene_name']].drop_duplicates()
-            all_genes.update([tuple(row) for row in genes_df.values])
+            frames.append(read_gene_annotations(tpm_path))
     
-    print(f"Found {len(all_genes):,} unique genes")
+    if frames:
+        genes = pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+    else:
+        genes = pd.DataFrame(columns=['gene_id', 'gene_name'])
+    print(f"Found {len(genes):,} unique genes")
     
     # Insert genes into database
     insert_query = """
@@ -105,19 +166,20 @@ def populate_genes_table(conn, data_dir: str, cancer_names: List[str]) -> Dict[s
         ON DUPLICATE KEY UPDATE gene_symbol = VALUES(gene_symbol)
     """
     
-    records = [(ensembl_id, gene_symbol) for ensembl_id, gene_symbol in all_genes]
+    # pd.NA is not understood by pymysql, so send missing symbols as NULL
+    genes = genes.astype(object).where(genes.notna(), None)
+    records = list(genes.itertuples(index=False, name=None))
     cur.executemany(insert_query, records)
     conn.commit()
     
-    # Fetch gene map
-    cur.execute("SELECT id, ensembl_id FROM genes")
-    gene_map = {row['ensembl_id']: row['id'] for row in cur.fetchall()}
+    # Fetch gene map (only the genes just inserted, not the whole table)
+    gene_map = fetch_id_map(cur, "genes", "ensembl_id", [r[0] for r in records])
     
     print(f"Populated {len(gene_map):,} genes")
     return gene_map
 
 
-def populate_sites_table(conn, data_dir: str, cancer_names: List[str]) -> Dict[str, int]:
+def populate_sites_table(conn, sites: List[SitePaths]) -> Dict[str, int]:
     """
     Extract site names from directory structure and populate sites table.
     Includes predefined list of cancer sites.
@@ -137,19 +199,16 @@ def populate_sites_table(conn, data_dir: str, cancer_names: List[str]) -> Dict[s
     
     # Get all site names from directories
     site_names = set(predefined_sites)
-    for cancer_name in cancer_names:
-        folder_path = os.path.join(data_dir, cancer_name)
-        if os.path.isdir(folder_path):
-            site_names.add(cancer_name)
+    site_names.update(site.name for site in sites)
     
     print(f"Found {len(site_names):,} sites (including {len(predefined_sites)} predefined)")
     
-    # Check which sites already exist in the database
-    cur.execute("SELECT name FROM sites")
-    existing_sites = {row['name'] for row in cur.fetchall()}
+    # Fetch existing sites once; only newly inserted sites need a lookup afterwards
+    cur.execute("SELECT id, name FROM sites")
+    site_map = {row['name']: row['id'] for row in cur.fetchall()}
     
     # Only insert sites that don't already exist
-    new_sites = site_names - existing_sites
+    new_sites = site_names - set(site_map)
     
     if new_sites:
         print(f"Inserting {len(new_sites):,} new sites...")
@@ -160,24 +219,46 @@ def populate_sites_table(conn, data_dir: str, cancer_names: List[str]) -> Dict[s
         cur.executemany(insert_query, [(name,) for name in new_sites])
         conn.commit()
         print(f"  Inserted: {', '.join(sorted(new_sites))}")
+        site_map.update(fetch_id_map(cur, "sites", "name", sorted(new_sites)))
     else:
         print("All sites already exist in database. No new sites to insert.")
     
-    # Fetch site map
-    cur.execute("SELECT id, name FROM sites")
-    site_map = {row['name']: row['id'] for row in cur.fetchall()}
-    
     print(f"Total sites in database: {len(site_map):,}")
     return site_map
 
 
-def populate_cancer_types_table(conn, data_dir: str, cancer_names: List[str], 
+def load_sample_sheets(sites: List[SitePaths]) -> Dict[str, pd.DataFrame]:
+    """
+    Read sample_sheet.csv once per site folder so later steps can share it.
+    Returns: Dictionary mapping cancer_name -> sample sheet DataFrame (string columns)
+    """
+    sample_sheets = {}
+    
+    for site in sites:
+        cancer_name, sample_sheet_path = site.name, site.sheet
+        if not os.path.exists(sample_sheet_path):
+            print(f"  WARNING: sample_sheet.csv not found for {cancer_name}, skipping")
+            print(f"    Expected path: {sample_sheet_path}")
+            continue
+        
+        try:
+            sample_sheets[cancer_name] = pd.read_csv(sample_sheet_path, dtype='string')
+            print(f"  {cancer_name}: Loaded sample_sheet.csv: {len(sample_sheets[cancer_name])} rows")
+        except Exception as e:
+            print(f"  ERROR reading sample_sheet.csv for {cancer_name}: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    return sample_sheets
+
+
+def populate_cancer_types_table(conn, sample_sheets: Dict[str, pd.DataFrame], 
                                  site_map: Dict[str, int]) -> Dict[str, int]:
     """
     Populate cancer_types table FIRST using sample_sheet.csv from each site folder.
     
     This function must run before populate_samples_table() because samples need cancer_type_id.
-    Reads sample_sheet.csv from each site folder and extracts unique TCGA codes.
+    Uses the sample sheets loaded by load_sample_sheets() and extracts unique TCGA codes.
     Maps TCGA codes to sites based on which folder they appear in.
     
     Returns: Dictionary mapping tcga_code -> cancer_type_id
@@ -191,28 +272,15 @@ def populate_cancer_types_table(conn, data_dir: str, cancer_names: List[str],
     # Format: {tcga_code: site_id}
     tcga_to_site = {}
     
-    for cancer_name in cancer_names:
-        folder_path = os.path.join(data_dir, cancer_name)
-        if not os.path.isdir(folder_path):
-            continue
-        
+    for cancer_name, sample_df in sample_sheets.items():
         # Get site_id for this cancer name
         site_id = site_map.get(cancer_name)
         if not site_id:
             print(f"  WARNING: Site ID not found for {cancer_name}, skipping")
             continue
         
-        # Read sample_sheet.csv from this site folder
-        sample_sheet_path = os.path.join(folder_path, "sample_sheet.csv")
-        if not os.path.exists(sample_sheet_path):
-            print(f"  WARNING: sample_sheet.csv not found for {cancer_name}, skipping")
-            print(f"    Expected path: {sample_sheet_path}")
-            continue
-        
         try:
             print(f"\n  Processing {cancer_name}...")
-            sample_df = pd.read_csv(sample_sheet_path)
-            print(f"    Loaded sample_sheet.csv: {len(sample_df)} rows")
             
             # Extract unique TCGA codes from sample sheet
             if 'tcga_code' in sample_df.columns:
@@ -227,7 +295,7 @@ def populate_cancer_types_table(conn, data_dir: str, cancer_names: List[str],
                 print(f"    ERROR: 'tcga_code' column not found in sample_sheet.csv")
                 print(f"    Available columns: {', '.join(sample_df.columns)}")
         except Exception as e:
-            print(f"    ERROR reading sample_sheet.csv: {e}")
+            print(f"    ERROR processing sample_sheet.csv: {e}")
             import traceback
             traceback.print_exc()
             continue
@@ -263,7 +331,7 @@ def populate_cancer_types_table(conn, data_dir: str, cancer_names: List[str],
     return cancer_type_map
 
 
-def populate_samples_table(conn, data_dir: str, cancer_names: List[str],
+def populate_samples_table(conn, sample_sheets: Dict[str, pd.DataFrame],
                            site_map: Dict[str, int], 
                            cancer_type_map: Dict[str, int]) -> Dict[str, int]:
     """
@@ -278,68 +346,46 @@ def populate_samples_table(conn, data_dir: str, cancer_names: List[str],
     samples_with_null_cancer_type = []
     tcga_codes_found = set()
     
-    for cancer_name in cancer_names:
-        folder_path = os.path.join(data_dir, cancer_name)
-        if not os.path.isdir(folder_path):
-            continue
-        
-        # Read sample_sheet.csv
-        sample_sheet_path = os.path.join(folder_path, "sample_sheet.csv")
-        if not os.path.exists(sample_sheet_path):
-            print(f"  WARNING: sample_sheet.csv not found for {cancer_name}, skipping")
-            continue
-        
+    for cancer_name, sample_df in sample_sheets.items():
         try:
-            sample_df = pd.read_csv(sample_sheet_path)
-            
             # Check required columns
             required_columns = ['sample_barcode', 'sample_type']
             if not all(col in sample_df.columns for col in required_columns):
                 print(f"  WARNING: Missing required columns in sample_sheet.csv for {cancer_name}")
                 continue
             
-            # Process each sample from sample sheet
-            for _, row in sample_df.iterrows():
-                sample_barcode = str(row['sample_barcode']).strip()
-                sample_type_raw = str(row['sample_type']).strip()
-                
-                # Normalize sample_type to "tumor" or "normal"
-                sample_type = normalize_sample_type(sample_type_raw)
-                
-                # Get TCGA code from sample sheet
-                tcga_code = None
-                if 'tcga_code' in sample_df.columns:
-                    tcga_code_val = row.get('tcga_code')
-                    if pd.notna(tcga_code_val):
-                        tcga_code = str(tcga_code_val).strip()
-                
-                # If no tcga_code column or value, try to extract from sample_barcode
-                if not tcga_code:
-                    parts = sample_barcode.split('-')
-                    if len(parts) >= 2 and parts[0] == 'TCGA':
-                        tcga_code = f"{parts[0]}-{parts[1]}"
-                
-                if tcga_code:
-                    tcga_codes_found.add(tcga_code)
-                
-                # Map TCGA code to cancer_type_id
-                cancer_type_id = cancer_type_map.get(tcga_code) if tcga_code else None
-                
-                if cancer_type_id is None and tcga_code:
-                    samples_with_null_cancer_type.append((sample_barcode, tcga_code))
-                elif cancer_type_id is None and not tcga_code:
-                    samples_with_null_cancer_type.append((sample_barcode, "NO-TCGA-CODE"))
-                
-                all_samples.append({
-                    'sample_barcode': sample_barcode,
-                    'sample_type': sample_type,
-                    'cancer_type_id': cancer_type_id
-                })
+            barcode = sample_df['sample_barcode'].str.strip()
+            
+            # Normalize sample_type to "tumor" or "normal"
+            sample_type_lower = sample_df['sample_type'].fillna('').str.strip().str.lower()
+            sample_type = np.where(
+                sample_type_lower.str.contains(_NORMAL_RE),
+                'normal', 'tumor'
+            )
+            
+            # Get TCGA code from sample sheet, falling back to the sample_barcode prefix
+            tcga_code = barcode.str.extract(r'^(TCGA-[^-]+)', expand=False)
+            if 'tcga_code' in sample_df.columns:
+                tcga_code = sample_df['tcga_code'].str.strip().replace('', pd.NA).fillna(tcga_code)
+            tcga_codes_found.update(tcga_code.dropna())
+            
+            # Map TCGA code to cancer_type_id
+            cancer_type_id = tcga_code.map(cancer_type_map).astype('Int64')
+            missing = cancer_type_id.isna()
+            samples_with_null_cancer_type.extend(
+                zip(barcode[missing], tcga_code[missing].fillna("NO-TCGA-CODE"))
+            )
+            
+            all_samples.extend(zip(
+                barcode.tolist(),
+                sample_type.tolist(),
+                cancer_type_id.astype(object).where(~missing, None).tolist()
+            ))
             
             print(f"  {cancer_name}: Processed {len(sample_df)} samples from sample_sheet.csv")
             
         except Exception as e:
-            print(f"  ERROR reading sample_sheet.csv for {cancer_name}: {e}")
+            print(f"  ERROR processing sample_sheet.csv for {cancer_name}: {e}")
             import traceback
             traceback.print_exc()
             continue
@@ -381,119 +427,166 @@ def populate_samples_table(conn, data_dir: str, cancer_names: List[str],
             cancer_type_id = VALUES(cancer_type_id)
     """
     
-    records = [(s['sample_barcode'], s['sample_type'], s['cancer_type_id']) 
-               for s in all_samples]
+    records = all_samples
     
     for i in range(0, len(records), BATCH_SIZE):
         batch = records[i:i + BATCH_SIZE]
         cur.executemany(insert_query, batch)
-        conn.commit()
         print(f"  Inserted batch {i:,}–{i + len(batch):,}")
+    conn.commit()  # one commit for the whole table, not per batch
     
-    # Fetch sample map
-    cur.execute("SELECT id, sample_barcode FROM samples")
-    sample_map = {row['sample_barcode']: row['id'] for row in cur.fetchall()}
+    # Fetch sample map (only the samples just inserted, not the whole table)
+    sample_map = fetch_id_map(cur, "samples", "sample_barcode",
+                              list(dict.fromkeys(r[0] for r in records)))
     
     print(f"Populated {len(sample_map):,} samples")
     return sample_map
 
 
-def populate_gene_expressions_table(conn, data_dir: str, cancer_names: List[str],
+def populate_gene_expressions_table(sites: List[SitePaths],
                                     gene_map: Dict[str, int], 
                                     sample_map: Dict[str, int]):
     """
-    Load expression data from CSV files and populate gene_expressions table.
+    Load expression data from CSV files and populate gene_expressions table,
+    along with the DEPTH2 and DEPTH scores of the tumor samples.
+    Cancer sites are independent, so they are processed in parallel worker processes.
     """
-    cur = conn.cursor()
+    if not sites:
+        return
     
-    for cancer_name in cancer_names:
-        folder_path = os.path.join(data_dir, cancer_name)
-        if not os.path.isdir(folder_path):
-            print(f"WARNING: Folder not found: {folder_path}")
-            continue
-        
-        print(f"\nProcessing {cancer_name}...")
+    with ProcessPoolExecutor(max_workers=min(MAX_WORKERS, len(sites))) as executor:
+        list(executor.map(process_site_expressions, sites,
+                          itertools.repeat(gene_map), itertools.repeat(sample_map)))
+
+
+def process_site_expressions(site: SitePaths,
+                             gene_map: Dict[str, int], sample_map: Dict[str, int]):
+    """
+    Worker: load tumor and normal expression data for one cancer site, then compute
+    DEPTH2 and DEPTH scores from the tumor matrices already in memory.
+    Opens its own database connection so it can run in a separate process.
+    """
+    cancer_name = site.name
+    print(f"\nProcessing {cancer_name}...")
+    
+    # LOAD DATA LOCAL INFILE is refused unless the client enables it
+    conn = get_connection(local_infile=True)
+    try:
+        # One cursor for the whole site, shared by the expression and DEPTH inserts
+        cur = conn.cursor()
         
-        for prefix in ['tumor', 'normal']:
-            process_expression_set(conn, folder_path, prefix, cancer_name, 
-                                  gene_map, sample_map)
+        for prefix, paths in [('tumor', site.tumor), ('normal', site.normal)]:
+            matrices = process_expression_set(conn, cur, paths, prefix, cancer_name,
+                                              gene_map, sample_map)
+            if prefix != 'tumor':
+                continue
+            if matrices is None:
+                # Expression load skipped (incomplete or compressed files): DEPTH only
+                # needs tumor TPM, so load whatever tumor matrices exist
+                matrices = read_tumor_matrices(paths)
+            if matrices is not None:
+                compute_and_insert_depth(conn, cur, cancer_name, matrices, sample_map)
+            else:
+                print(f"  WARNING: Tumor TPM file not found for {cancer_name}, skipping DEPTH scores")
+    finally:
+        conn.close()
 
 
-def process_expression_set(conn, folder_path: str, prefix: str, cancer_name: str,
-                          gene_map: Dict[str, int], sample_map: Dict[str, int]):
+def process_expression_set(conn, cur, paths: Tuple[str, str, str], prefix: str, cancer_name: str,
+                          gene_map: Dict[str, int], 
+                          sample_map: Dict[str, int]) -> Dict[str, pd.DataFrame]:
     """
     Process one expression type (tumor or normal) and load into gene_expressions table.
+    Returns: Dictionary of numeric genes x samples matrices keyed by
+             "tpm", "fpkm", "fpkm_uq" (None if the files are missing)
     """
     print(f"  Processing {prefix.upper()} data...")
-    cur = conn.cursor()
     
     # File paths
-    tpm_path = os.path.join(folder_path, f"{prefix}_tpm.csv")
-    fpkm_path = os.path.join(folder_path, f"{prefix}_fpkm.csv")
-    fpkm_uq_path = os.path.join(folder_path, f"{prefix}_fpkm_uq.csv")
+    tpm_path, fpkm_path, fpkm_uq_path = paths
     
     # Check existence
     if not all(os.path.exists(p) for p in [tpm_path, fpkm_path, fpkm_uq_path]):
         print(f"  WARNING: Missing {prefix} files, skipping.")
-        return
+        return None
     
-    # Load CSVs
+    # Load CSVs (multithreaded Arrow reader, sample columns decoded as numbers)
     print("  Loading CSV files...")
-    read_opts = dict(low_memory=False, dtype=str)
-    tpm_df = pd.read_csv(tpm_path, **read_opts)
-    fpkm_df = pd.read_csv(fpkm_path, **read_opts)
-    fpkm_uq_df = pd.read_csv(fpkm_uq_path, **read_opts)
-    
-    # Drop gene_name and normalize gene_id
-    for df in (tpm_df, fpkm_df, fpkm_uq_df):
-        df.drop(columns=["gene_name"], errors="ignore", inplace=True)
-        df.rename(columns={"gene_id": "ensembl_id"}, inplace=True)
-    
-    # Melt (wide=> long)
-    print("  Melting dataframes...")
-    tpm_long = tpm_df.melt(id_vars="ensembl_id", var_name="sample_barcode", value_name="tpm")
-    fpkm_long = fpkm_df.melt(id_vars="ensembl_id", var_name="sample_barcode", value_name="fpkm")
-    fpkm_uq_long = fpkm_uq_df.melt(id_vars="ensembl_id", var_name="sample_barcode", value_name="fpkm_uq")
-    
-    # Merge all three
-    merged_df = tpm_long.merge(fpkm_long, on=["ensembl_id", "sample_barcode"])
-    merged_df = merged_df.merge(fpkm_uq_long, on=["ensembl_id", "sample_barcode"])
+    tpm, fpkm, fpkm_uq = [read_expression_matrix(p) for p in (tpm_path, fpkm_path, fpkm_uq_path)]
+    
+    # Align the three matrices on the same (gene x sample) grid
+    if not all(tpm.index.equals(m.index) and tpm.columns.equals(m.columns) for m in (fpkm, fpkm_uq)):
+        print("  WARNING: TPM/FPKM/FPKM-UQ files differ, keeping common genes and samples")
+        genes = tpm.index.intersection(fpkm.index).intersection(fpkm_uq.index)
+        samples = tpm.columns.intersection(fpkm.columns).intersection(fpkm_uq.columns)
+        tpm, fpkm, fpkm_uq = [m.loc[genes, samples] for m in (tpm, fpkm, fpkm_uq)]
+    
+    # Stack (wide => long) in one pass: one row per (gene, sample) with three value columns
+    print("  Stacking matrices...")
+    n_genes, n_samples = tpm.shape
+    values = np.stack(
+        [m.to_numpy() for m in (tpm, fpkm, fpkm_uq)], axis=-1
+    ).reshape(-1, 3)
+    merged_df = pd.DataFrame(values, columns=["tpm", "fpkm", "fpkm_uq"])
+    merged_df.insert(0, "ensembl_id", np.repeat(tpm.index.to_numpy(), n_samples))
+    merged_df.insert(1, "sample_barcode", np.tile(tpm.columns.to_numpy(), n_genes))
     print(f"  Merged rows: {len(merged_df):,}")
     
     # Map gene_id and sample_id
     print("  Mapping IDs...")
-    merged_df["gene_id"] = merged_df["ensembl_id"].map(gene_map)
-    merged_df["sample_id"] = merged_df["sample_barcode"].map(sample_map)
+    merged_df["gene_id"] = map_ids(merged_df["ensembl_id"], gene_map)
+    merged_df["sample_id"] = map_ids(merged_df["sample_barcode"], sample_map)
     merged_df.dropna(subset=["gene_id", "sample_id"], inplace=True)
     
-    # Keep only needed columns and convert to numeric
-    merged_df = merged_df[["gene_id", "sample_id", "tpm", "fpkm", "fpkm_uq"]]
-    merged_df[["tpm", "fpkm", "fpkm_uq"]] = merged_df[["tpm", "fpkm", "fpkm_uq"]].apply(
-        pd.to_numeric, errors="coerce"
+    # Keep only needed columns (values are already numeric from the Arrow reader);
+    # integer ids are written as "1234" rather than "1234.0" in the TSV
+    merged_df = merged_df[["gene_id", "sample_id", "tpm", "fpkm", "fpkm_uq"]].astype(
+        {"gene_id": np.int64, "sample_id": np.int64}
     )
     
     print(f"  Ready to insert {len(merged_df):,} records")
     
-    # Write to temporary TSV file
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".tsv", delete=False) as tmpfile:
-        tmp_path = tmpfile.name
-        merged_df.to_csv(tmp_path, sep="\t", header=False, index=False)
+    table = pa.Table.from_pandas(merged_df, preserve_index=False)
+    write_options = pacsv.WriteOptions(include_header=False, delimiter="\t")
+    use_fifo = hasattr(os, "mkfifo")
+    
+    if use_fifo:
+        # Stream the TSV through a named pipe so MySQL reads rows while they are written
+        tmp_dir = tempfile.mkdtemp()
+        tmp_path = os.path.join(tmp_dir, "pipe.tsv")
+        os.mkfifo(tmp_path)
+        writer = threading.Thread(target=write_tsv_to_pipe,
+                                  args=(table, tmp_path, write_options), daemon=True)
+        writer.start()
+    else:
+        # Write to temporary TSV file (multithreaded Arrow CSV writer)
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".tsv", delete=False) as tmpfile:
+            tmp_path = tmpfile.name
+        pacsv.write_csv(table, tmp_path, write_options=write_options)
+    
+    # Bulk load only: ids come from the genes/samples maps, so skip the per-row
+    # unique and foreign key checks. They are switched back on in the finally block,
+    # because the DEPTH upserts on this session rely on UNIQUE(sample_id).
+    cur.execute("SET unique_checks = 0")
+    cur.execute("SET foreign_key_checks = 0")
     
     # Try fast LOAD DATA LOCAL INFILE
     try:
         print("  Bulk loading using LOAD DATA LOCAL INFILE...")
         # Escape backslashes in path for SQL
         escaped_path = tmp_path.replace('\\', '\\\\')
+        # LOAD DATA has no ON DUPLICATE KEY UPDATE; REPLACE rewrites every column
+        # of an existing row, which is the same upsert for this table.
+        # Empty fields (NaN in the Arrow TSV) are stored as NULL.
         load_sql = f"""
         LOAD DATA LOCAL INFILE '{escaped_path}'
-        INTO TABLE gene_expressions
+        REPLACE INTO TABLE gene_expressions
         FIELDS TERMINATED BY '\\t'
         LINES TERMINATED BY '\\n'
-        (gene_id, sample_id, tpm, fpkm, fpkm_uq)
-        ON DUPLICATE KEY UPDATE
-            tpm = VALUES(tpm),
-            fpkm = VALUES(fpkm),
-            fpkm_uq = VALUES(fpkm_uq)
+        (gene_id, sample_id, @tpm, @fpkm, @fpkm_uq)
+        SET tpm = NULLIF(@tpm, ''),
+            fpkm = NULLIF(@fpkm, ''),
+            fpkm_uq = NULLIF(@fpkm_uq, '')
         """
         cur.execute(load_sql)
         conn.commit()
@@ -512,172 +605,243 @@ def process_expression_set(conn, folder_path: str, prefix: str, cancer_name: str
                 fpkm_uq = VALUES(fpkm_uq)
         """
         
-        records = merged_df.values.tolist()
+        # NaN is not valid SQL, send missing values as NULL
+        records = merged_df.astype(object).where(merged_df.notna(), None).values.tolist()
         for i in range(0, len(records), BATCH_SIZE):
             batch = records[i:i + BATCH_SIZE]
             cur.executemany(insert_query, batch)
-            conn.commit()
             print(f"  Inserted batch {i:,}–{i + len(batch):,}")
+        conn.commit()  # one commit per file, not per batch
     
     finally:
-        os.remove(tmp_path)
+        cur.execute("SET unique_checks = 1")
+        cur.execute("SET foreign_key_checks = 1")
+        if use_fifo:
+            if writer.is_alive():
+                # MySQL never opened the pipe: attach and drop a reader to unblock the writer
+                try:
+                    os.close(os.open(tmp_path, os.O_RDONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass
+            writer.join()
+            os.remove(tmp_path)
+            os.rmdir(tmp_dir)
+        else:
+            os.remove(tmp_path)
         print(f"  Cleaned up temp file")
+    
+    return {"tpm": tpm, "fpkm": fpkm, "fpkm_uq": fpkm_uq}
+
 
-def populate_depth_scores(conn, data_dir: str, cancer_names: List[str], 
-                          sample_map: Dict[str, int]):
+def write_tsv_to_pipe(table: pa.Table, fifo_path: str, write_options: pacsv.WriteOptions):
     """
-    Calculate and populate DEPTH2 and DEPTH scores for all tumor samples.
-    Processes each cancer site, loads expression data, applies log2 transformation,
-    calculates scores, and inserts them into depth2_scores and depth_scores tables.
+    Write an Arrow table as TSV into a named pipe. Runs in a background thread
+    while LOAD DATA LOCAL INFILE consumes the other end.
     """
-    print("\n" + "=" * 60)
-    print("STEP 6: Calculating and populating DEPTH2 and DEPTH scores")
-    print("=" * 60)
-    cur = conn.cursor()
+    try:
+        with open(fifo_path, "wb") as pipe:
+            pacsv.write_csv(table, pipe, write_options=write_options)
+    except (BrokenPipeError, OSError):
+        # Reader went away (LOAD DATA failed); the caller falls back to INSERTs
+        pass
+
+
+def read_expression_table(path: str) -> pd.DataFrame:
+    """
+    Read an expression CSV (gene_id, gene_name, one column per sample) with the
+    pyarrow reader, decoding sample columns straight to float64 (the gene_expressions
+    columns are DOUBLE; only the DEPTH matrices are narrowed to float32).
+    Returns: DataFrame with the gene_id/gene_name columns and float64 sample columns
+    """
+    # Peek at the header so every sample column can be typed up front
+    column_names = pacsv.open_csv(path).schema.names
+    column_types = {name: pa.float64() for name in column_names}
+    column_types.update({"gene_id": pa.string(), "gene_name": pa.string()})
     
-    for cancer_name in cancer_names:
-        folder_path = os.path.join(data_dir, cancer_name)
-        if not os.path.isdir(folder_path):
+    try:
+        table = pacsv.read_csv(
+            path,
+            read_options=pacsv.ReadOptions(use_threads=True),
+            # Empty gene_name fields become null (missing symbol), as with pandas
+            convert_options=pacsv.ConvertOptions(column_types=column_types,
+                                                 strings_can_be_null=True),
+        )
+    except pa.ArrowInvalid as e:
+        # Non-numeric values in a sample column: let pandas parse (Arrow-backed) and coerce
+        print(f"  WARNING: pyarrow could not parse {path} ({e}), falling back to pandas")
+        df = pd.read_csv(path, dtype_backend="pyarrow")
+        sample_columns = [c for c in df.columns if c not in ("gene_id", "gene_name")]
+        df[sample_columns] = df[sample_columns].apply(pd.to_numeric, errors="coerce").astype(np.float64)
+        return df
+    
+    return table.to_pandas()
+
+
+def read_expression_matrix(path: str) -> pd.DataFrame:
+    """
+    Read an expression CSV as a numeric matrix (see read_expression_table).
+    Returns: float64 DataFrame of genes x samples indexed by gene_id
+    """
+    df = read_expression_table(path)
+    return df.drop(columns=["gene_name"], errors="ignore").set_index("gene_id")
+
+
+def read_tumor_matrices(paths: Tuple[str, str, str]) -> Dict[str, pd.DataFrame]:
+    """
+    Load the tumor matrices available for DEPTH scoring, falling back to the
+    .csv.gz copy of each file. TPM is required, FPKM/FPKM-UQ are optional.
+    Returns: Dictionary of matrices keyed by "tpm", "fpkm", "fpkm_uq"
+             (None for missing files), or None if there is no TPM file
+    """
+    matrices = {}
+    for key, path in zip(("tpm", "fpkm", "fpkm_uq"), paths):
+        if not os.path.exists(path):
+            path = f"{path}.gz"
+        matrices[key] = read_expression_matrix(path) if os.path.exists(path) else None
+    
+    return matrices if matrices["tpm"] is not None else None
+
+
+def read_gene_annotations(path: str) -> pd.DataFrame:
+    """
+    Read only the gene_id and gene_name columns of an expression CSV with the
+    pyarrow reader, keeping them as Arrow-backed strings.
+    Returns: DataFrame with gene_id and gene_name columns
+    """
+    table = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(use_threads=True),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=["gene_id", "gene_name"],
+            column_types={"gene_id": pa.string(), "gene_name": pa.string()},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+def log2_depth_scores(matrices: Dict[str, pd.DataFrame]
+                      ) -> Tuple[Dict[str, pd.Series], Dict[str, pd.Series]]:
+    """
+    Apply log2(x + 1) and compute DEPTH and DEPTH2 for the tpm/fpkm/fpkm_uq matrices.
+    Each matrix is copied once to float32, transformed in place and reduced by one
+    fused kernel call, so only one matrix's buffers are alive at a time.
+    FPKM/FPKM-UQ are aligned to the TPM genes and samples.
+    Returns: (DEPTH, DEPTH2) dictionaries of per-sample Series keyed by
+             "tpm", "fpkm", "fpkm_uq" (None for missing matrices)
+    """
+    tpm = matrices["tpm"]
+    depth_scores = dict.fromkeys(("tpm", "fpkm", "fpkm_uq"))
+    depth2_scores = dict.fromkeys(("tpm", "fpkm", "fpkm_uq"))
+    
+    for key in depth_scores:
+        matrix = matrices.get(key)
+        if matrix is None:
             continue
+        if not (matrix.index.equals(tpm.index) and matrix.columns.equals(tpm.columns)):
+            matrix = matrix.reindex(index=tpm.index, columns=tpm.columns)
         
-        print(f"\nProcessing {cancer_name}...")
-        
-        # File paths for tumor data
-        tpm_path = os.path.join(folder_path, "tumor_tpm.csv")
-        fpkm_path = os.path.join(folder_path, "tumor_fpkm.csv")
-        fpkm_uq_path = os.path.join(folder_path, "tumor_fpkm_uq.csv")
-        
-        # Check if compressed files exist
-        if not os.path.exists(tpm_path):
-            tpm_path = os.path.join(folder_path, "tumor_tpm.csv.gz")
-        if not os.path.exists(fpkm_path):
-            fpkm_path = os.path.join(folder_path, "tumor_fpkm.csv.gz")
-        if not os.path.exists(fpkm_uq_path):
-            fpkm_uq_path = os.path.join(folder_path, "tumor_fpkm_uq.csv.gz")
+        arr = matrix.to_numpy(dtype=np.float32, copy=True)
+        np.add(arr, 1, out=arr)
+        np.log2(arr, out=arr)
         
-        # Check if at least TPM file exists
-        if not os.path.exists(tpm_path):
-            print(f"  WARNING: Tumor TPM file not found for {cancer_name}, skipping")
-            continue
-        
-        try:
-            # Load expression data
-            print(f"  Loading expression data...")
-            tpm_df = pd.read_csv(tpm_path, dtype=str, low_memory=False)
-            sample_columns = [col for col in tpm_df.columns if col not in ['gene_id', 'gene_name']]
-            
-            if not sample_columns:
-                print(f"  WARNING: No sample columns found in {cancer_name}, skipping")
-                continue
-            
-            print(f"  Found {len(tpm_df)} genes and {len(sample_columns)} tumor samples")
-            
-            # Prepare expression matrices (all genes, all samples)
-            expr_matrix_tpm = tpm_df.set_index('gene_id')[sample_columns].copy()
-            expr_matrix_tpm = expr_matrix_tpm.apply(pd.to_numeric, errors='coerce')
-            
-            expr_matrix_fpkm = None
-            expr_matrix_fpkm_uq = None
-            
-            if os.path.exists(fpkm_path):
-                fpkm_df = pd.read_csv(fpkm_path, dtype=str, low_memory=False)
-                expr_matrix_fpkm = fpkm_df.set_index('gene_id')[sample_columns].copy()
-                expr_matrix_fpkm = expr_matrix_fpkm.apply(pd.to_numeric, errors='coerce')
-            
-            if os.path.exists(fpkm_uq_path):
-                fpkm_uq_df = pd.read_csv(fpkm_uq_path, dtype=str, low_memory=False)
-                expr_matrix_fpkm_uq = fpkm_uq_df.set_index('gene_id')[sample_columns].copy()
-                expr_matrix_fpkm_uq = expr_matrix_fpkm_uq.apply(pd.to_numeric, errors='coerce')
-            
-            # Apply log2 transformation
-            print(f"  Applying log2 transformation...")
-            expr_matrix_tpm_log2 = np.log2(expr_matrix_tpm + 1)
-            expr_matrix_fpkm_log2 = np.log2(expr_matrix_fpkm + 1) if expr_matrix_fpkm is not None else None
-            expr_matrix_fpkm_uq_log2 = np.log2(expr_matrix_fpkm_uq + 1) if expr_matrix_fpkm_uq is not None else None
-            
-            # Calculate DEPTH2 scores
-            print(f"  Calculating DEPTH2 scores...")
-            depth2_scores_tpm = depth2_calculation(expr_matrix_tpm_log2)
-            depth2_scores_fpkm = depth2_calculation(expr_matrix_fpkm_log2) if expr_matrix_fpkm_log2 is not None else None
-            depth2_scores_fpkm_uq = depth2_calculation(expr_matrix_fpkm_uq_log2) if expr_matrix_fpkm_uq_log2 is not None else None
-            
-            # Calculate DEPTH scores
-            print(f"  Calculating DEPTH scores...")
-            depth_scores_tpm = depth_calculation(expr_matrix_tpm_log2)
-            depth_scores_fpkm = depth_calculation(expr_matrix_fpkm_log2) if expr_matrix_fpkm_log2 is not None else None
-            depth_scores_fpkm_uq = depth_calculation(expr_matrix_fpkm_uq_log2) if expr_matrix_fpkm_uq_log2 is not None else None
-            
-            # Insert DEPTH2 scores
-            print(f"  Inserting DEPTH2 scores...")
-            insert_depth2_query = """
-                INSERT INTO depth2_scores (sample_id, tpm, fpkm, fpkm_uq)
-                VALUES (%s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    tpm = VALUES(tpm),
-                    fpkm = VALUES(fpkm),
-                    fpkm_uq = VALUES(fpkm_uq)
-            """
-            
-            depth2_records = []
-            for sample_barcode in sample_columns:
-                sample_id = sample_map.get(sample_barcode)
-                if sample_id:
-                    tpm_val = depth2_scores_tpm.get(sample_barcode)
-                    fpkm_val = depth2_scores_fpkm.get(sample_barcode) if depth2_scores_fpkm is not None else None
-                    fpkm_uq_val = depth2_scores_fpkm_uq.get(sample_barcode) if depth2_scores_fpkm_uq is not None else None
-                    depth2_records.append((
-                        int(sample_id),
-                        float(tpm_val) if pd.notna(tpm_val) else None,
-                        float(fpkm_val) if fpkm_val is not None and pd.notna(fpkm_val) else None,
-                        float(fpkm_uq_val) if fpkm_uq_val is not None and pd.notna(fpkm_uq_val) else None
-                    ))
-            
-            if depth2_records:
-                cur.executemany(insert_depth2_query, depth2_records)
-                conn.commit()
-                print(f"    Inserted {len(depth2_records)} DEPTH2 score records")
-            
-            # Insert DEPTH scores
-            print(f"  Inserting DEPTH scores...")
-            insert_depth_query = """
-                INSERT INTO depth_scores (sample_id, tpm, fpkm, fpkm_uq)
-                VALUES (%s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    tpm = VALUES(tpm),
-                    fpkm = VALUES(fpkm),
-                    fpkm_uq = VALUES(fpkm_uq)
-            """
-            
-            depth_records = []
-            for sample_barcode in sample_columns:
-                sample_id = sample_map.get(sample_barcode)
-                if sample_id:
-                    tpm_val = depth_scores_tpm.get(sample_barcode)
-                    fpkm_val = depth_scores_fpkm.get(sample_barcode) if depth_scores_fpkm is not None else None
-                    fpkm_uq_val = depth_scores_fpkm_uq.get(sample_barcode) if depth_scores_fpkm_uq is not None else None
-                    depth_records.append((
-                        int(sample_id),
-                        float(tpm_val) if pd.notna(tpm_val) else None,
-                        float(fpkm_val) if fpkm_val is not None and pd.notna(fpkm_val) else None,
-                        float(fpkm_uq_val) if fpkm_uq_val is not None and pd.notna(fpkm_uq_val) else None
-                    ))
-            
-            if depth_records:
-                cur.executemany(insert_depth_query, depth_records)
-                conn.commit()
-                print(f"    Inserted {len(depth_records)} DEPTH score records")
-            
-            print(f"  Completed {cancer_name}: {len(sample_columns)} samples processed")
-            
-        except Exception as e:
-            print(f"  ERROR processing {cancer_name}: {e}")
-            import traceback
-            traceback.print_exc()
-            continue
+        depth, depth2 = depth_and_depth2_array(arr)
+        depth_scores[key] = pd.Series(depth, index=tpm.columns)
+        depth2_scores[key] = pd.Series(depth2, index=tpm.columns)
     
-    print("\n" + "=" * 60)
-    print("DEPTH2 and DEPTH scores populated successfully!")
-    print("=" * 60)
+    return depth_scores, depth2_scores
+
+
+def build_score_records(sample_columns: List[str], sample_map: Dict[str, int],
+                        tpm_scores: pd.Series, fpkm_scores: pd.Series = None,
+                        fpkm_uq_scores: pd.Series = None) -> List[tuple]:
+    """
+    Align per-sample score Series with sample ids using vectorized Series.map.
+    Samples without an id are dropped; missing or NaN scores become None.
+    Returns: List of (sample_id, tpm, fpkm, fpkm_uq) tuples
+    """
+    samples = pd.Series(sample_columns)
+    sample_ids = samples.map(sample_map)
+    keep = sample_ids.notna()
+    samples = samples[keep]
+    
+    columns = [sample_ids[keep].astype(np.int64).tolist()]
+    for scores in (tpm_scores, fpkm_scores, fpkm_uq_scores):
+        if scores is None:
+            columns.append([None] * len(samples))
+        else:
+            values = samples.map(scores)
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+    
+    return list(zip(*columns))
+
+
+def compute_and_insert_depth(conn, cur, cancer_name: str, matrices: Dict[str, pd.DataFrame],
+                             sample_map: Dict[str, int]):
+    """
+    Calculate and populate DEPTH2 and DEPTH scores for the tumor samples of one site.
+    Uses the numeric tumor matrices already loaded by process_expression_set(), applies
+    log2 transformation, calculates scores, and inserts them into depth2_scores and
+    depth_scores tables.
+    """
+    print(f"  Calculating DEPTH2 and DEPTH scores for {cancer_name}...")
+    try:
+        sample_columns = list(matrices["tpm"].columns)
+
+        if not sample_columns:
+            print(f"  WARNING: No sample columns found in {cancer_name}, skipping")
+            return
+
+        # Apply log2 transformation and calculate DEPTH and DEPTH2 scores
+        # (one fused pass per matrix)
+        print(f"  Applying log2 transformation and calculating DEPTH and DEPTH2 scores...")
+        depth_scores, depth2_scores = log2_depth_scores(matrices)
+
+        # Insert DEPTH2 scores
+        print(f"  Inserting DEPTH2 scores...")
+        insert_depth2_query = """
+            INSERT INTO depth2_scores (sample_id, tpm, fpkm, fpkm_uq)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                tpm = VALUES(tpm),
+                fpkm = VALUES(fpkm),
+                fpkm_uq = VALUES(fpkm_uq)
+        """
+
+        depth2_records = build_score_records(sample_columns, sample_map, depth2_scores["tpm"],
+                                             depth2_scores["fpkm"], depth2_scores["fpkm_uq"])
+
+        if depth2_records:
+            cur.executemany(insert_depth2_query, depth2_records)
+            conn.commit()
+            print(f"    Inserted {len(depth2_records)} DEPTH2 score records")
+
+        # Insert DEPTH scores
+        print(f"  Inserting DEPTH scores...")
+        insert_depth_query = """
+            INSERT INTO depth_scores (sample_id, tpm, fpkm, fpkm_uq)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                tpm = VALUES(tpm),
+                fpkm = VALUES(fpkm),
+                fpkm_uq = VALUES(fpkm_uq)
+        """
+
+        depth_records = build_score_records(sample_columns, sample_map, depth_scores["tpm"],
+                                            depth_scores["fpkm"], depth_scores["fpkm_uq"])
+
+        if depth_records:
+            cur.executemany(insert_depth_query, depth_records)
+            conn.commit()
+            print(f"    Inserted {len(depth_records)} DEPTH score records")
+
+        print(f"  Completed {cancer_name}: {len(sample_columns)} samples processed")
+
+    except Exception as e:
+        print(f"  ERROR calculating DEPTH scores for {cancer_name}: {e}")
+        import traceback
+        traceback.print_exc()
+
 
 def main():
     """Main function to populate all tables."""
@@ -687,39 +851,39 @@ def main():
     
     # Automatically detect cancer sites from data directory
     print(f"\nScanning data directory: {DATA_DIR}")
-    cancer_names = get_cancer_sites_from_directory(DATA_DIR)
+    sites = get_cancer_sites_from_directory(DATA_DIR)
     
-    if not cancer_names:
+    if not sites:
         print("ERROR: No cancer sites found in data directory.")
         print("Please ensure CSV files are present in subdirectories of:", DATA_DIR)
         return
     
-    print(f"Found {len(cancer_names)} cancer site(s): {', '.join(cancer_names)}")
+    print(f"Found {len(sites)} cancer site(s): {', '.join(site.name for site in sites)}")
     print("=" * 60)
     
     conn = get_connection()
     
     try:
         # Step 1: Populate genes table
-        gene_map = populate_genes_table(conn, DATA_DIR, cancer_names)
+        gene_map = populate_genes_table(conn, sites)
         
         # Step 2: Populate sites table
-        site_map = populate_sites_table(conn, DATA_DIR, cancer_names)
+        site_map = populate_sites_table(conn, sites)
+        
+        # Read every sample_sheet.csv once for steps 3 and 4
+        print("\nLoading sample sheets...")
+        sample_sheets = load_sample_sheets(sites)
         
         # Step 3: Populate cancer_types table
-        cancer_type_map = populate_cancer_types_table(conn, DATA_DIR, cancer_names, site_map)
+        cancer_type_map = populate_cancer_types_table(conn, sample_sheets, site_map)
         
         # Step 4: Populate samples table
-        sample_map = populate_samples_table(conn, DATA_DIR, cancer_names, 
+        sample_map = populate_samples_table(conn, sample_sheets, 
                                            site_map, cancer_type_map)
         
-        # Step 5: Populate gene_expressions table
-        print("\nPopulating gene_expressions table...")
-        populate_gene_expressions_table(conn, DATA_DIR, cancer_names, 
-                                       gene_map, sample_map)
-        
-        # Step 6: Calculate and populate DEPTH2 and DEPTH scores
-        populate_depth_scores(conn, DATA_DIR, cancer_names, sample_map)
+        # Step 5: Populate gene_expressions table and DEPTH2/DEPTH scores
+        print("\nPopulating gene_expressions, depth2_scores and depth_scores tables...")
+        populate_gene_expressions_table(sites, gene_map, sample_map)
         
         print("\n" + "=" * 60)
         print("All tables populated successfully!")
@@ -746,24 +910,12 @@ def example_populate_single_file():
     print("EXAMPLE: Populating Single File (Thymus/tumor_tpm.csv)")
     print("=" * 60)
     
-    # Example file path - try different possible folder names
+    # Example file path - one directory pass; prefer the known folder names,
+    # otherwise take any folder with tumor_tpm.csv
     possible_folders = ["Thymus"]
-    example_file = None
-    for folder in possible_folders:
-        test_path = os.path.join(DATA_DIR, folder, "tumor_tpm.csv")
-        if os.path.exists(test_path):
-            example_file = test_path
-            break
-    
-    if example_file is None:
-        # Try to find any folder with tumor_tpm.csv
-        for item in os.listdir(DATA_DIR):
-            item_path = os.path.join(DATA_DIR, item)
-            if os.path.isdir(item_path):
-                test_path = os.path.join(item_path, "tumor_tpm.csv")
-                if os.path.exists(test_path):
-                    example_file = test_path
-                    break
+    matches = sorted(Path(DATA_DIR).glob("*/tumor_tpm.csv"))
+    preferred = [m for m in matches if m.parent.name in possible_folders]
+    example_file = str((preferred or matches)[0]) if matches else None
     
     if example_file is None:
         print(f"ERROR: Example file not found in any expected location.")
@@ -776,19 +928,23 @@ def example_populate_single_file():
     # Extract folder name from path
     folder_name = os.path.basename(os.path.dirname(example_file))
     
-    conn = get_connection()
+    conn = get_connection(local_infile=True)
     cur = conn.cursor()
     
     try:
         # Step 1: Load the CSV file
         print("\nStep 1: Loading CSV file...")
-        df = pd.read_csv(example_file, dtype=str, low_memory=False)
-        print(f"  Loaded {len(df)} genes and {len(df.columns) - 2} samples")
-        print(f"  Columns: gene_id, gene_name, and {len(df.columns) - 2} sample columns")
+        # Arrow reader: parsed once, then split into gene annotations and the
+        # numeric matrix indexed by gene_id
+        df = read_expression_table(example_file)
+        tpm_matrix = df.drop(columns=["gene_name"]).set_index("gene_id")
+        print(f"  Loaded {len(tpm_matrix)} genes and {len(tpm_matrix.columns)} samples")
+        print(f"  Columns: gene_id, gene_name, and {len(tpm_matrix.columns)} sample columns")
         
         # Step 2: Extract genes
         print("\nStep 2: Extracting unique genes...")
-        genes_df = df[['gene_id', 'gene_name']].drop_duplicates()
+        genes_df = df[["gene_id", "gene_name"]].drop_duplicates()
+        del df
         print(f"  Found {len(genes_df)} unique genes")
         print(f"  Example genes:")
         for idx, row in genes_df.head(3).iterrows():
@@ -801,20 +957,20 @@ def example_populate_single_file():
             VALUES (%s, %s)
             ON DUPLICATE KEY UPDATE gene_symbol = VALUES(gene_symbol)
         """
-        gene_records = [(row['gene_id'], row['gene_name']) for _, row in genes_df.iterrows()]
+        # pd.NA is not understood by pymysql, so send missing symbols as NULL
+        gene_records = list(genes_df.astype(object).where(genes_df.notna(), None)
+                            .itertuples(index=False, name=None))
         cur.executemany(insert_genes_query, gene_records)
         conn.commit()
         print(f"  Inserted {len(gene_records)} genes ")
         
         # Step 4: Get gene map
-        cur.execute("SELECT id, ensembl_id FROM genes WHERE ensembl_id IN %s", 
-                   (tuple(genes_df['gene_id'].tolist()),))
-        gene_map = {row['ensembl_id']: row['id'] for row in cur.fetchall()}
+        gene_map = fetch_id_map(cur, "genes", "ensembl_id", genes_df['gene_id'].tolist())
         print(f"  Retrieved {len(gene_map)} gene IDs from database")
         
         # Step 5: Extract sample barcodes
         print("\nStep 5: Extracting sample barcodes...")
-        sample_columns = [col for col in df.columns if col not in ['gene_id', 'gene_name']]
+        sample_columns = list(tpm_matrix.columns)
         print(f"  Found {len(sample_columns)} sample barcodes")
         print(f"  Example samples: {', '.join(sample_columns[:5])}")
         
@@ -836,6 +992,8 @@ def example_populate_single_file():
         folder_path = os.path.dirname(example_file)
         sample_sheet_path = os.path.join(folder_path, "sample_sheet.csv")
         
+        # Read once here and reuse in Step 8 (stays None if missing or unreadable)
+        sample_sheet_df = None
         cancer_type_map = {}
         if os.path.exists(sample_sheet_path):
             try:
@@ -863,9 +1021,8 @@ def example_populate_single_file():
                         print(f"  Inserted {len(cancer_type_records)} cancer types")
                     
                     # Fetch cancer_type map
-                    cur.execute("SELECT id, tcga_code FROM cancer_types WHERE tcga_code IN %s",
-                               (tuple([str(tc).strip() for tc in unique_tcga_codes if pd.notna(tc)]),))
-                    cancer_type_map = {row['tcga_code']: row['id'] for row in cur.fetchall()}
+                    cancer_type_map = fetch_id_map(cur, "cancer_types", "tcga_code",
+                                                   [str(tc).strip() for tc in unique_tcga_codes if pd.notna(tc)])
                     print(f"  Retrieved {len(cancer_type_map)} cancer type IDs")
                 else:
                     print(f"  WARNING: 'tcga_code' column not found in sample_sheet.csv")
@@ -881,10 +1038,8 @@ def example_populate_single_file():
         # Step 8: Insert samples using sample_sheet.csv
         print("\nStep 8: Inserting sample metadata using sample_sheet.csv...")
         
-        if os.path.exists(sample_sheet_path):
+        if sample_sheet_df is not None:
             try:
-                sample_sheet_df = pd.read_csv(sample_sheet_path)
-                
                 # Prepare sample records with cancer_type_id
                 sample_records = []
                 for _, row in sample_sheet_df.iterrows():
@@ -946,12 +1101,10 @@ def example_populate_single_file():
             sample_records = [(barcode, 'tumor') for barcode in sample_columns]
             cur.executemany(insert_samples_query, sample_records)
             conn.commit()
-            print(f"  Inserted {len(sample_records)} sample records (no sample_sheet.csv found)")
+            print(f"  Inserted {len(sample_records)} sample records (no usable sample_sheet.csv found)")
         
         # Step 9: Get sample map (for all samples)
-        cur.execute("SELECT id, sample_barcode FROM samples WHERE sample_barcode IN %s",
-                   (tuple(sample_columns),))
-        sample_map = {row['sample_barcode']: row['id'] for row in cur.fetchall()}
+        sample_map = fetch_id_map(cur, "samples", "sample_barcode", sample_columns)
         print(f"  Retrieved {len(sample_map)} sample IDs from database")
         
         # Define example samples for expression data insertion (first 5)
@@ -968,58 +1121,34 @@ def example_populate_single_file():
         fpkm_uq_df = None
         
         if os.path.exists(fpkm_path):
-            fpkm_df = pd.read_csv(fpkm_path, dtype=str, low_memory=False)
+            fpkm_df = read_expression_matrix(fpkm_path)
             print(f"  Loaded FPKM data: {len(fpkm_df)} genes")
         else:
             print(f"  WARNING: FPKM file not found: {fpkm_path}")
         
         if os.path.exists(fpkm_uq_path):
-            fpkm_uq_df = pd.read_csv(fpkm_uq_path, dtype=str, low_memory=False)
+            fpkm_uq_df = read_expression_matrix(fpkm_uq_path)
             print(f"  Loaded FPKM-UQ data: {len(fpkm_uq_df)} genes")
         else:
             print(f"  WARNING: FPKM-UQ file not found: {fpkm_uq_path}")
         
-        # Step 11: Melt dataframes (wide to long format) - first 5 samples
+        # Step 11: Stack dataframes (wide to long format) - first 5 samples
         print("\nStep 10: Converting wide format to long format...")
-        tpm_long = df.head(100).melt(  # Use first 100 genes as example
-            id_vars=['gene_id', 'gene_name'],
-            value_vars=example_samples,  # Use first 5 samples as example
-            var_name='sample_barcode',
-            value_name='tpm'
-        )
-        
-        fpkm_long = None
-        fpkm_uq_long = None
-        
-        if fpkm_df is not None:
-            fpkm_long = fpkm_df.head(100).melt(  # Use first 100 genes as example
-                id_vars=['gene_id', 'gene_name'],
-                value_vars=example_samples,  # Use first 5 samples as example
-                var_name='sample_barcode',
-                value_name='fpkm'
-            )
-        
-        if fpkm_uq_df is not None:
-            fpkm_uq_long = fpkm_uq_df.head(100).melt(  # Use first 100 genes as example
-                id_vars=['gene_id', 'gene_name'],
-                value_vars=example_samples,  # Use first 5 samples as example
-                var_name='sample_barcode',
-                value_name='fpkm_uq'
-            )
-        
-        # Merge all three dataframes
-        merged_df = tpm_long.copy()
-        if fpkm_long is not None:
-            merged_df = merged_df.merge(fpkm_long[['gene_id', 'sample_barcode', 'fpkm']], 
-                                      on=['gene_id', 'sample_barcode'], how='left')
-        else:
-            merged_df['fpkm'] = None
+        # Use first 100 genes and first 5 samples as example; FPKM/FPKM-UQ are
+        # aligned to the same (gene x sample) grid, so no melt/merge is needed
+        example_tpm = tpm_matrix.head(100)[example_samples]
+        example_genes = example_tpm.index
+        planes = [example_tpm.to_numpy()]
+        for matrix in (fpkm_df, fpkm_uq_df):
+            if matrix is not None:
+                planes.append(matrix.reindex(index=example_genes, columns=example_samples).to_numpy())
+            else:
+                planes.append(np.full(example_tpm.shape, np.nan))
         
-        if fpkm_uq_long is not None:
-            merged_df = merged_df.merge(fpkm_uq_long[['gene_id', 'sample_barcode', 'fpkm_uq']], 
-                                      on=['gene_id', 'sample_barcode'], how='left')
-        else:
-            merged_df['fpkm_uq'] = None
+        values = np.stack(planes, axis=-1).reshape(-1, 3)
+        merged_df = pd.DataFrame(values, columns=['tpm', 'fpkm', 'fpkm_uq'])
+        merged_df.insert(0, 'gene_id', np.repeat(example_genes.to_numpy(), len(example_samples)))
+        merged_df.insert(1, 'sample_barcode', np.tile(np.asarray(example_samples), len(example_genes)))
         
         print(f"  Converted to long format: {len(merged_df)} rows")
         print(f"  Example rows:")
@@ -1028,85 +1157,126 @@ def example_populate_single_file():
         
         # Step 12: Map IDs and prepare for insertion
         print("\nStep 11: Mapping gene and sample IDs...")
-        merged_df['gene_id_db'] = merged_df['gene_id'].map(gene_map)
-        merged_df['sample_id_db'] = merged_df['sample_barcode'].map(sample_map)
+        # Categorical codes index an id array (one gather) instead of a dict lookup per row
+        merged_df['gene_id_db'] = map_ids(merged_df['gene_id'], gene_map)
+        merged_df['sample_id_db'] = map_ids(merged_df['sample_barcode'], sample_map)
         merged_df = merged_df.dropna(subset=['gene_id_db', 'sample_id_db'])
         
-        # Convert to numeric
-        merged_df['tpm'] = pd.to_numeric(merged_df['tpm'], errors='coerce')
-        merged_df['fpkm'] = pd.to_numeric(merged_df['fpkm'], errors='coerce')
-        merged_df['fpkm_uq'] = pd.to_numeric(merged_df['fpkm_uq'], errors='coerce')
-        
         print(f"  Mapped {len(merged_df)} records ready for insertion")
         
         # Step 13: Insert expression data
         print("\nStep 12: Inserting expression data...")
-        insert_expr_query = """
-            INSERT INTO gene_expressions (gene_id, sample_id, tpm, fpkm, fpkm_uq)
-            VALUES (%s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                tpm = VALUES(tpm),
-                fpkm = VALUES(fpkm),
-                fpkm_uq = VALUES(fpkm_uq)
-        """
-        expr_records = [
-            (int(row['gene_id_db']), int(row['sample_id_db']), 
-             float(row['tpm']) if pd.notna(row['tpm']) else None,
-             float(row['fpkm']) if pd.notna(row['fpkm']) else None,
-             float(row['fpkm_uq']) if pd.notna(row['fpkm_uq']) else None)
-            for _, row in merged_df.iterrows()
-        ]
+        expr_df = merged_df[['gene_id_db', 'sample_id_db', 'tpm', 'fpkm', 'fpkm_uq']].astype(
+            {'gene_id_db': np.int64, 'sample_id_db': np.int64}
+        )
+        # Numeric columns go straight from NumPy to the TSV through the Arrow writer
+        # (NaN becomes an empty field, mapped back to NULL by LOAD DATA)
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".tsv", delete=False) as tmpfile:
+            tmp_path = tmpfile.name
+        pacsv.write_csv(pa.Table.from_pandas(expr_df, preserve_index=False), tmp_path,
+                        write_options=pacsv.WriteOptions(include_header=False, delimiter="\t"))
+        
+        # One transaction for the whole load; ids come from gene_map/sample_map,
+        # so skip the per-row unique and foreign key checks while loading
+        conn.autocommit(False)
+        cur.execute("SET unique_checks = 0")
+        cur.execute("SET foreign_key_checks = 0")
         
-        # Insert in batches
-        for i in range(0, len(expr_records), BATCH_SIZE):
-            batch = expr_records[i:i + BATCH_SIZE]
-            cur.executemany(insert_expr_query, batch)
+        try:
+            # Load into a key-less staging table, then upsert in one statement
+            print("  Bulk loading using LOAD DATA LOCAL INFILE...")
+            cur.execute("""
+                CREATE TEMPORARY TABLE stg_expr
+                SELECT gene_id, sample_id, tpm, fpkm, fpkm_uq FROM gene_expressions LIMIT 0
+            """)
+            escaped_path = tmp_path.replace('\\', '\\\\')
+            cur.execute(f"""
+                LOAD DATA LOCAL INFILE '{escaped_path}'
+                INTO TABLE stg_expr
+                FIELDS TERMINATED BY '\\t'
+                LINES TERMINATED BY '\\n'
+                (gene_id, sample_id, @tpm, @fpkm, @fpkm_uq)
+                SET tpm = NULLIF(@tpm, ''),
+                    fpkm = NULLIF(@fpkm, ''),
+                    fpkm_uq = NULLIF(@fpkm_uq, '')
+            """)
+            cur.execute("""
+                INSERT INTO gene_expressions (gene_id, sample_id, tpm, fpkm, fpkm_uq)
+                SELECT gene_id, sample_id, tpm, fpkm, fpkm_uq FROM stg_expr
+                ON DUPLICATE KEY UPDATE 
+                    tpm = VALUES(tpm),
+                    fpkm = VALUES(fpkm),
+                    fpkm_uq = VALUES(fpkm_uq)
+            """)
             conn.commit()
-            print(f"  Inserted batch {i:,}–{i + len(batch):,}")
+            print(f"  Total inserted: {len(expr_df)} expression records")
         
-        print(f"  Total inserted: {len(expr_records)} expression records")
+        except Exception as e:
+            conn.rollback()
+            print(f"  ERROR: LOAD DATA failed: {e}")
+            print("  Falling back to executemany()...")
+            insert_expr_query = """
+                INSERT INTO gene_expressions (gene_id, sample_id, tpm, fpkm, fpkm_uq)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE 
+                    tpm = VALUES(tpm),
+                    fpkm = VALUES(fpkm),
+                    fpkm_uq = VALUES(fpkm_uq)
+            """
+            # Column-wise: .tolist() yields native ints/floats, NaN becomes NULL
+            value_columns = []
+            for col in ('tpm', 'fpkm', 'fpkm_uq'):
+                vals = expr_df[col].to_numpy(dtype=np.float64)
+                value_columns.append(np.where(np.isnan(vals), None, vals).tolist())
+            expr_records = list(zip(
+                expr_df['gene_id_db'].to_numpy(dtype=np.int64).tolist(),
+                expr_df['sample_id_db'].to_numpy(dtype=np.int64).tolist(),
+                *value_columns
+            ))
+            
+            # Insert in batches
+            for i in range(0, len(expr_records), BATCH_SIZE):
+                batch = expr_records[i:i + BATCH_SIZE]
+                cur.executemany(insert_expr_query, batch)
+                print(f"  Inserted batch {i:,}–{i + len(batch):,}")
+            conn.commit()  # one commit for the whole load, not per batch
+            
+            print(f"  Total inserted: {len(expr_records)} expression records")
+        
+        finally:
+            cur.execute("DROP TEMPORARY TABLE IF EXISTS stg_expr")
+            cur.execute("SET unique_checks = 1")
+            cur.execute("SET foreign_key_checks = 1")
+            os.remove(tmp_path)
         
         # Step 14: Calculate and populate DEPTH2 and DEPTH scores
         print("\nStep 13: Calculating DEPTH2 and DEPTH scores...")
         
         # Prepare expression matrices (all genes, all samples) for score calculation
         # Set gene_id as index and keep only sample columns
-        expr_matrix_tpm = df.set_index('gene_id')[sample_columns].copy()
-        expr_matrix_tpm = expr_matrix_tpm.apply(pd.to_numeric, errors='coerce')
+        expr_matrix_tpm = tpm_matrix[sample_columns]
         print(f"  Prepared TPM matrix: {expr_matrix_tpm.shape[0]} genes x {expr_matrix_tpm.shape[1]} samples")
         
         expr_matrix_fpkm = None
         expr_matrix_fpkm_uq = None
         
         if fpkm_df is not None:
-            expr_matrix_fpkm = fpkm_df.set_index('gene_id')[sample_columns].copy()
-            expr_matrix_fpkm = expr_matrix_fpkm.apply(pd.to_numeric, errors='coerce')
+            expr_matrix_fpkm = fpkm_df[sample_columns]
             print(f"  Prepared FPKM matrix: {expr_matrix_fpkm.shape[0]} genes x {expr_matrix_fpkm.shape[1]} samples")
         
         if fpkm_uq_df is not None:
-            expr_matrix_fpkm_uq = fpkm_uq_df.set_index('gene_id')[sample_columns].copy()
-            expr_matrix_fpkm_uq = expr_matrix_fpkm_uq.apply(pd.to_numeric, errors='coerce')
+            expr_matrix_fpkm_uq = fpkm_uq_df[sample_columns]
             print(f"  Prepared FPKM-UQ matrix: {expr_matrix_fpkm_uq.shape[0]} genes x {expr_matrix_fpkm_uq.shape[1]} samples")
         
-        # Apply log2 transformation (add pseudocount of 1 to avoid log(0))
-        print("  Applying log2 transformation...")
-        expr_matrix_tpm_log2 = np.log2(expr_matrix_tpm + 1)
-        expr_matrix_fpkm_log2 = np.log2(expr_matrix_fpkm + 1) if expr_matrix_fpkm is not None else None
-        expr_matrix_fpkm_uq_log2 = np.log2(expr_matrix_fpkm_uq + 1) if expr_matrix_fpkm_uq is not None else None
-        
-        # Calculate DEPTH2 scores on log2-transformed data
-        print("  Calculating DEPTH2 scores...")
-        depth2_scores_tpm = depth2_calculation(expr_matrix_tpm_log2)
-        depth2_scores_fpkm = depth2_calculation(expr_matrix_fpkm_log2) if expr_matrix_fpkm_log2 is not None else None
-        depth2_scores_fpkm_uq = depth2_calculation(expr_matrix_fpkm_uq_log2) if expr_matrix_fpkm_uq_log2 is not None else None
-        
-        # Calculate DEPTH scores on log2-transformed data (using tumor data only, no normal reference)
-        print("  Calculating DEPTH scores...")
-        depth_scores_tpm = depth_calculation(expr_matrix_tpm_log2)
-        depth_scores_fpkm = depth_calculation(expr_matrix_fpkm_log2) if expr_matrix_fpkm_log2 is not None else None
-        depth_scores_fpkm_uq = depth_calculation(expr_matrix_fpkm_uq_log2) if expr_matrix_fpkm_uq_log2 is not None else None
+        # Apply log2 transformation (add pseudocount of 1 to avoid log(0)) and calculate
+        # DEPTH and DEPTH2 scores (tumor data only, no normal reference), one fused
+        # pass per matrix
+        print("  Applying log2 transformation and calculating DEPTH and DEPTH2 scores...")
+        depth_scores, depth2_scores = log2_depth_scores(
+            {"tpm": expr_matrix_tpm, "fpkm": expr_matrix_fpkm, "fpkm_uq": expr_matrix_fpkm_uq}
+        )
         
-        print(f"  Calculated scores for {len(depth2_scores_tpm)} samples")
+        print(f"  Calculated scores for {len(depth2_scores['tpm'])} samples")
         
         # Insert DEPTH2 scores
         print("\nStep 14: Inserting DEPTH2 scores...")
@@ -1119,19 +1289,9 @@ def example_populate_single_file():
                 fpkm_uq = VALUES(fpkm_uq)
         """
         
-        depth2_records = []
-        for sample_barcode in sample_columns:  # Insert scores for all samples
-            sample_id = sample_map.get(sample_barcode)
-            if sample_id:
-                tpm_val = depth2_scores_tpm.get(sample_barcode)
-                fpkm_val = depth2_scores_fpkm.get(sample_barcode) if depth2_scores_fpkm is not None else None
-                fpkm_uq_val = depth2_scores_fpkm_uq.get(sample_barcode) if depth2_scores_fpkm_uq is not None else None
-                depth2_records.append((
-                    int(sample_id),
-                    float(tpm_val) if pd.notna(tpm_val) else None,
-                    float(fpkm_val) if fpkm_val is not None and pd.notna(fpkm_val) else None,
-                    float(fpkm_uq_val) if fpkm_uq_val is not None and pd.notna(fpkm_uq_val) else None
-                ))
+        # Score Series are indexed by sample barcode, align them in one vectorized pass
+        depth2_records = build_score_records(sample_columns, sample_map, depth2_scores['tpm'],
+                                             depth2_scores['fpkm'], depth2_scores['fpkm_uq'])
         
         cur.executemany(insert_depth2_query, depth2_records)
         conn.commit()
@@ -1148,19 +1308,9 @@ def example_populate_single_file():
                 fpkm_uq = VALUES(fpkm_uq)
         """
         
-        depth_records = []
-        for sample_barcode in sample_columns:  # Insert scores for all samples
-            sample_id = sample_map.get(sample_barcode)
-            if sample_id:
-                tpm_val = depth_scores_tpm.get(sample_barcode)
-                fpkm_val = depth_scores_fpkm.get(sample_barcode) if depth_scores_fpkm is not None else None
-                fpkm_uq_val = depth_scores_fpkm_uq.get(sample_barcode) if depth_scores_fpkm_uq is not None else None
-                depth_records.append((
-                    int(sample_id),
-                    float(tpm_val) if pd.notna(tpm_val) else None,
-                    float(fpkm_val) if fpkm_val is not None and pd.notna(fpkm_val) else None,
-                    float(fpkm_uq_val) if fpkm_uq_val is not None and pd.notna(fpkm_uq_val) else None
-                ))
+        # Score Series are indexed by sample barcode, align them in one vectorized pass
+        depth_records = build_score_records(sample_columns, sample_map, depth_scores['tpm'],
+                                            depth_scores['fpkm'], depth_scores['fpkm_uq'])
         
         cur.executemany(insert_depth_query, depth_records)
         conn.commit()
@@ -1,11 +1,14 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import zscore
 
 def depth2_calculation(expr_matrix, normal=None):
-    # z-score per row (gene expression across samples)
-    z_scores = zscore(expr_matrix, axis=1, nan_policy='omit')
-    abs_z_scores = np.abs(z_scores)
-    depth2_scores = abs_z_scores.std(axis=0)   # std deviation per sample
+    arr = np.ascontiguousarray(expr_matrix.to_numpy(dtype=np.float64))
+
+    # z-score per row (gene expression across samples), NaNs omitted
+    mu = np.nanmean(arr, axis=1, keepdims=True)
+    sd = np.nanstd(arr, axis=1, ddof=0, keepdims=True)
+    # constant genes get z = 0 instead of NaN so they do not blank every sample
+    abs_z_scores = np.abs((arr - mu) / np.where(sd == 0, 1, sd))
+    depth2_scores = np.nanstd(abs_z_scores, axis=0, ddof=0)   # std deviation per sample
 
     return pd.Series(depth2_scores, index=expr_matrix.columns)
@@ -1,5 +1,35 @@
+import numpy as np
 import pandas as pd
 
+try:
+    from numba import njit, prange
+except ImportError:  # optional: fall back to the NumPy implementation below
+    njit = None
+
+if njit is not None:
+    # NaN-aware fastmath subset: "nnan"/"ninf" would let LLVM drop the isnan checks
+    @njit(parallel=True, cache=True, fastmath={"reassoc", "contract", "arcp"})
+    def depth_core(a, ref):
+        """Per-sample std (ddof=1) of squared deviations from ref, NaNs skipped."""
+        n_genes, n_samples = a.shape
+        out = np.empty(n_samples)
+        for j in prange(n_samples):
+            # Single pass (Welford): running mean and sum of squared differences
+            # of the squared deviations, so each deviation is computed once
+            n = 0
+            mean = 0.0
+            m2 = 0.0
+            for i in range(n_genes):
+                d = a[i, j] - ref[i]
+                if not np.isnan(d):
+                    x = d * d
+                    n += 1
+                    delta = x - mean
+                    mean += delta / n
+                    m2 += delta * (x - mean)
+            out[j] = np.sqrt(m2 / (n - 1)) if n >= 2 else np.nan
+        return out
+
 def depth_calculation(tumor_df, normal_df=None) -> pd.Series:
     """
     DEPTH heterogeneity score.
@@ -13,17 +43,26 @@ def depth_calculation(tumor_df, normal_df=None) -> pd.Series:
     if tumor_df is None or tumor_df.empty:
         return pd.Series(dtype=float)
 
+    a = tumor_df.to_numpy(dtype=np.float64, copy=False)
+
     # Reference mean: use normal if present, else tumor mean
     if normal_df is not None and not normal_df.empty:
-        mean_ref = normal_df.mean(axis=1, skipna=True)
+        # align genes to the tumor rows (pandas .sub did this by label)
+        ref = np.nanmean(normal_df.reindex(tumor_df.index).to_numpy(dtype=np.float64), axis=1)
     else:
-        mean_ref = tumor_df.mean(axis=1, skipna=True)
+        ref = np.nanmean(a, axis=1)
+
+    if njit is not None:
+        # Column-major copy so each parallel worker streams one sample contiguously
+        depth_scores = depth_core(np.asfortranarray(a), np.ascontiguousarray(ref))
+        return pd.Series(depth_scores, index=tumor_df.columns)
 
-    # Squared deviation of each tumor sample from reference mean
-    score = (tumor_df.sub(mean_ref, axis=0) ** 2)
+    # Squared deviation of each tumor sample from reference mean (one buffer, in place)
+    buf = np.empty_like(a)
+    np.subtract(a, ref[:, None], out=buf)
+    np.square(buf, out=buf)
 
     # DEPTH score = std across genes for each tumor sample
-    depth_scores = score.std(axis=0, skipna=True)
-    # print(depth_scores.head())
+    depth_scores = np.nanstd(buf, axis=0, ddof=1)
 
-    return depth_scores
+    return pd.Series(depth_scores, index=tumor_df.columns)
@@ -0,0 +1,28 @@
+import numpy as np
+
+
+def depth_and_depth2_array(a):
+    """
+    DEPTH and DEPTH2 on a genes x samples array.
+    Arguments:
+        a: float array (log2-transformed), genes x samples
+
+    Returns:
+        (np.ndarray, np.ndarray): DEPTH and DEPTH2 score per sample
+    """
+    # Per-gene deviation from the mean across samples (float64 accumulation,
+    # float32 input is widened while computing the deviations)
+    mu = np.nanmean(a, axis=1, dtype=np.float64, keepdims=True)
+    dev = np.subtract(a, mu, dtype=np.float64)
+    sq = np.square(dev)
+
+    # DEPTH: std across genes of the squared deviations
+    depth_scores = np.nanstd(sq, axis=0, ddof=1)
+
+    # DEPTH2: std across genes of |z|, with per-gene sd (ddof=0) from the same squares
+    sd = np.sqrt(np.nanmean(sq, axis=1, keepdims=True))
+    np.abs(dev, out=dev)
+    np.divide(dev, np.where(sd == 0, 1, sd), out=dev)
+    depth2_scores = np.nanstd(dev, axis=0, ddof=0)
+
+    return depth_scores, depth2_scores
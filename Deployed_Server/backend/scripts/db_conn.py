@@ -16,10 +16,13 @@ DB_CONFIG = {
     "cursorclass": pymysql.cursors.DictCursor,
 }
 
-def get_connection():
-    """Create and return a database connection."""
+def get_connection(**overrides):
+    """
+    Create and return a database connection.
+    Keyword arguments override DB_CONFIG (e.g. local_infile=True for LOAD DATA LOCAL INFILE).
+    """
     try:
-        conn = pymysql.connect(**DB_CONFIG)
+        conn = pymysql.connect(**{**DB_CONFIG, **overrides})
         logger.info("Successfully connected to the database")
         return conn
     except pymysql.MySQLError as e: